@@ -8,6 +8,7 @@ ICLOUD_INPUT_FOLDERS = [
     Path.home() / "Library/Mobile Documents/iCloud~dougs~SimpleWatch/Documents/log_to_obsidian",
 ]
 LOG_FILE = Path("/tmp/log-to-obsidian.log")
+PENDING_FILE = Path.home() / ".cache/logfromwatch/pending.json"  # Input files that failed, for backoff
 
 # Format types
 FORMAT_PLAIN = "plain"           # Just the text
@@ -0,0 +1,129 @@
+"""Shared daily note helpers for the sync script and the HTTP server."""
+import os
+import re
+import shutil
+import tempfile
+from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
+
+from config import (
+    DAILY_NOTES_FOLDER,
+    FORMAT_PLAIN, FORMAT_BLOCKQUOTE, FORMAT_BULLET, FORMAT_NUMBERED, FORMAT_CHECKBOX,
+)
+
+# Entry formatters by format type: (text, index) -> formatted line
+FORMATTERS = {
+    FORMAT_PLAIN: lambda text, index: text,
+    FORMAT_BLOCKQUOTE: lambda text, index: f"> {text}",
+    FORMAT_BULLET: lambda text, index: f"- {text}",
+    FORMAT_NUMBERED: lambda text, index: f"{index}. {text}",
+    FORMAT_CHECKBOX: lambda text, index: f"- [ ] {text}",
+}
+
+# Empty template lines under a field marker that an entry replaces
+PLACEHOLDER_LINES = frozenset({"", ">", "-", *(f"{i}." for i in range(1, 20))})
+
+# Next divider or section header after a "##" marker (whichever comes first)
+SECTION_BOUNDARY_RE = re.compile(r"\n(?:---|## )")
+
+
+def atomic_write(path: Path, data: str) -> os.stat_result:
+    """
+    Write a file atomically: temp file in the same folder, fsync, then os.replace.
+    Readers see either the old or the new content, never a torn/zeroed file.
+    Returns the stat of the written file (os.replace keeps its inode, mtime and size),
+    taken before the replace so a later change by someone else can't be mistaken for it.
+
+    Caveat: the rename swaps in a new inode, so iCloud and some file watchers
+    may see a delete + create rather than an in-place modification.
+    """
+    tmp = tempfile.NamedTemporaryFile(
+        mode="w", dir=path.parent, prefix=f".{path.name}.", suffix=".tmp", delete=False
+    )
+    try:
+        with tmp:
+            tmp.write(data)
+            tmp.flush()
+            os.fsync(tmp.fileno())
+            st = os.fstat(tmp.fileno())
+        try:
+            shutil.copymode(path, tmp.name)
+        except FileNotFoundError:
+            pass
+        os.replace(tmp.name, path)
+    except BaseException:
+        Path(tmp.name).unlink(missing_ok=True)
+        raise
+    return st
+
+
+def get_daily_note_path(for_date: datetime = None) -> Path:
+    """Get the path to the daily note for a given date."""
+    if for_date is None:
+        for_date = datetime.now()
+    return daily_note_path_for(for_date.strftime("%Y-%m-%d"))
+
+
+@lru_cache(maxsize=1)
+def daily_note_path_for(date_str: str) -> Path:
+    """Build (once per day) the daily note path for a YYYY-MM-DD date string."""
+    return DAILY_NOTES_FOLDER / f"{date_str}.md"
+
+
+def placeholder_kind(line: str) -> str:
+    """Kind of an empty template line: "1." for any numbered slot, else the line itself."""
+    return "1." if line[:-1].isdigit() else line
+
+
+def insert_at_marker(content: str, marker: str, entry_text: str) -> str | None:
+    """
+    Insert entry after a marker in the content.
+    Returns new content or None if marker not found.
+    """
+    marker_pos = content.find(marker)
+    if marker_pos == -1:
+        return None
+
+    line_end = content.find("\n", marker_pos)
+    if line_end == -1:
+        line_end = len(content)
+    else:
+        line_end += 1  # Include the newline
+
+    # For section headers (##), find next section or divider
+    if marker.startswith("##"):
+        boundary = SECTION_BOUNDARY_RE.search(content, line_end)
+        insert_pos = boundary.start() + 1 if boundary else line_end
+    else:
+        # For field markers, replace empty placeholder line if present
+        first_line_end = content.find("\n", line_end)
+        if first_line_end == -1:
+            first_line_end = len(content)
+        first_line = content[line_end:first_line_end].strip()
+
+        # Check if first line is an empty placeholder (>, -, 1., etc.)
+        if first_line in PLACEHOLDER_LINES:
+            # Fill one template slot per entry line ("1.\n2.\n3." takes up to three items),
+            # only with slots of the same kind, and keep the rest for later entries. A blank
+            # line only fills its own slot so the spacing before the next field stays
+            kind = placeholder_kind(first_line)
+            slots = entry_text.count("\n") + 1 if first_line else 1
+            run_end = first_line_end
+            for _ in range(slots - 1):
+                if run_end >= len(content):
+                    break
+                next_end = content.find("\n", run_end + 1)
+                if next_end == -1:
+                    next_end = len(content)
+                line = content[run_end + 1:next_end].strip()
+                if not line or line not in PLACEHOLDER_LINES or placeholder_kind(line) != kind:
+                    break
+                run_end = next_end
+            return "".join((content[:line_end], entry_text, content[run_end:]))
+
+        # Insert after marker
+        insert_pos = line_end
+
+    # Build the result in one allocation rather than chained concatenation
+    return "".join((content[:insert_pos], entry_text, "\n", content[insert_pos:]))
@@ -0,0 +1,39 @@
+"""Shared logging setup for the sync script and the HTTP server."""
+import atexit
+import logging
+import logging.handlers
+from pathlib import Path
+
+LOG_FORMAT = "%(asctime)s [%(levelname)s] %(message)s"
+LOG_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def setup_logging(name: str, log_file: Path, buffered: bool = False) -> logging.Logger:
+    """
+    Create a logger that writes to the console and to log_file.
+
+    The log file is only opened when the first record reaches it. With buffered=True
+    (for short-lived runs), file records are held in memory and written in one go
+    at exit, or immediately when an ERROR is logged.
+    """
+    log = logging.getLogger(name)
+    log.setLevel(logging.INFO)
+    formatter = logging.Formatter(LOG_FORMAT, datefmt=LOG_DATE_FORMAT)
+
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(formatter)
+    log.addHandler(console_handler)
+
+    file_handler = logging.FileHandler(log_file, delay=True)
+    file_handler.setFormatter(formatter)
+
+    if buffered:
+        memory_handler = logging.handlers.MemoryHandler(
+            capacity=1024, flushLevel=logging.ERROR, target=file_handler
+        )
+        log.addHandler(memory_handler)
+        atexit.register(memory_handler.flush)
+    else:
+        log.addHandler(file_handler)
+
+    return log
@@ -8,40 +8,46 @@ then deletes processed files.
 
 JSON format: {"section": "concerns", "text": "My text...", "ts": "2026-01-23T09:15:00"}
 """
-import socket
 import subprocess
 import sys
 import json
-import logging
+import os
 import time
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-# Prevent slow reverse DNS lookups in logging module
-socket.getfqdn = socket.gethostname
+from config import ICLOUD_INPUT_FOLDERS, LOG_FILE, PENDING_FILE, SECTIONS, FORMAT_PLAIN
+from daily_notes import FORMATTERS, atomic_write, get_daily_note_path, insert_at_marker
+from log_setup import setup_logging
 
-from config import (
-    DAILY_NOTES_FOLDER, ICLOUD_INPUT_FOLDERS, LOG_FILE, SECTIONS,
-    FORMAT_PLAIN, FORMAT_BLOCKQUOTE, FORMAT_BULLET, FORMAT_NUMBERED, FORMAT_CHECKBOX,
-)
+# Logging setup (file records are buffered and written at exit)
+log = setup_logging(__name__, LOG_FILE, buffered=True)
 
-# Logging setup
-log = logging.getLogger(__name__)
-log.setLevel(logging.INFO)
+# Backoff for input files that keep failing (doubles per failed run)
+PENDING_BACKOFF_BASE = 60  # seconds
+PENDING_BACKOFF_MAX = 6 * 60 * 60
 
-console_handler = logging.StreamHandler()
-console_handler.setFormatter(logging.Formatter(
-    "%(asctime)s [%(levelname)s] %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S"
-))
-log.addHandler(console_handler)
+# Times to re-read and re-apply when the daily note changes on disk mid-run
+NOTE_WRITE_ATTEMPTS = 3
 
-file_handler = logging.FileHandler(LOG_FILE)
-file_handler.setFormatter(logging.Formatter(
-    "%(asctime)s [%(levelname)s] %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S"
-))
-log.addHandler(file_handler)
+# Claimed input files are renamed to <name>.inflight.<pid> while being processed
+INFLIGHT_MARKER = ".inflight."
+
+# Section configs keyed by lowercase name (entries are matched case-insensitively)
+SECTIONS_BY_NAME = {name.lower(): config for name, config in SECTIONS.items()}
+
+
+def brctl_download(path: Path) -> None:
+    """Ask iCloud to download a file or folder via brctl (failures are only logged)."""
+    try:
+        log.debug("Triggering iCloud download for: %s", path)
+        subprocess.run(['/usr/bin/brctl', 'download', str(path)], check=True, timeout=30)
+    except subprocess.CalledProcessError:
+        log.debug("brctl download failed for %s (may need Full Disk Access)", path)
+    except subprocess.TimeoutExpired:
+        log.debug("brctl download timed out")
+    except Exception as e:
+        log.debug("Could not trigger brctl download: %s", e)
 
 
 def trigger_icloud_download(path: Path, retries: int = 10, delay: float = 2) -> bool:
@@ -50,18 +56,21 @@ def trigger_icloud_download(path: Path, retries: int = 10, delay: float = 2) ->
     Returns True if path exists and is accessible.
     """
     if not path.exists():
-        log.warning(f"Path does not exist: {path}")
+        log.warning("Path does not exist: %s", path)
         return False
 
+    # Only spawn brctl if iCloud still has placeholder (.name.icloud) files here
     try:
-        log.debug(f"Triggering iCloud download for: {path}")
-        subprocess.run(['/usr/bin/brctl', 'download', str(path)], check=True, timeout=30)
-    except subprocess.CalledProcessError:
-        log.debug(f"brctl download failed for {path} (may need Full Disk Access)")
-    except subprocess.TimeoutExpired:
-        log.debug("brctl download timed out")
-    except Exception as e:
-        log.debug(f"Could not trigger brctl download: {e}")
+        has_placeholders = any(
+            name.startswith(".") and name.endswith(".icloud") for name in os.listdir(path)
+        )
+    except OSError:
+        has_placeholders = True  # Can't list yet (iCloud syncing), let brctl try
+
+    if has_placeholders:
+        brctl_download(path)
+    else:
+        log.debug("No iCloud placeholders in %s, skipping brctl", path)
 
     # Wait for files to become available
     for i in range(retries):
@@ -71,7 +80,7 @@ def trigger_icloud_download(path: Path, retries: int = 10, delay: float = 2) ->
             return True
         except OSError as e:
             if e.errno == 11:  # Resource deadlock (iCloud syncing)
-                log.debug(f"Waiting for iCloud sync... ({i + 1}/{retries})")
+                log.debug("Waiting for iCloud sync... (%s/%s)", i + 1, retries)
                 time.sleep(delay)
             else:
                 raise
@@ -82,132 +91,194 @@ def load_json_file(file_path: Path, retries: int = 5, delay: float = 5) -> dict
     """Load a JSON file, waiting for iCloud if needed."""
     for i in range(retries):
         try:
-            # Use cat to force iCloud download - shell commands trigger downloads
-            # more reliably than Python's open()
-            result = subprocess.run(
-                ['/bin/cat', str(file_path)],
-                capture_output=True,
-                text=True,
-                timeout=30
-            )
-            if result.returncode != 0:
-                log.debug(f"cat failed (iCloud syncing?), waiting... ({i + 1}/{retries})")
+            # Zero bytes means iCloud/Shortcuts hasn't delivered it yet; don't open it
+            if file_path.stat().st_size == 0:
+                if i == 0:
+                    brctl_download(file_path)
+                log.debug("File is empty, waiting... (%s/%s)", i + 1, retries)
                 time.sleep(delay)
                 continue
 
-            content = result.stdout
-            if not content.strip():
-                log.debug(f"File is empty, waiting... ({i + 1}/{retries})")
+            # Reading the file forces iCloud to materialize it
+            with open(file_path, "rb") as f:
+                data = f.read()
+
+            if not data.strip():
+                log.debug("File is empty, waiting... (%s/%s)", i + 1, retries)
                 time.sleep(delay)
                 continue
 
-            return json.loads(content)
+            return json.loads(data)
 
-        except subprocess.TimeoutExpired:
-            log.debug(f"cat timed out (iCloud syncing?), waiting... ({i + 1}/{retries})")
-            time.sleep(delay)
-        except json.JSONDecodeError as e:
-            log.warning(f"Invalid JSON in {file_path}: {e}")
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            log.warning("Invalid JSON in %s: %s", file_path, e)
             return None
+        except OSError as e:
+            if e.errno in (11, 35):  # Resource deadlock / EAGAIN (iCloud syncing)
+                log.debug("File not downloaded yet (iCloud syncing?), waiting... (%s/%s)", i + 1, retries)
+            else:
+                log.debug("Error reading %s: %s, waiting... (%s/%s)", file_path, e, i + 1, retries)
+            time.sleep(delay)
         except Exception as e:
-            log.debug(f"Error reading {file_path}: {e}, waiting... ({i + 1}/{retries})")
+            log.debug("Error reading %s: %s, waiting... (%s/%s)", file_path, e, i + 1, retries)
             time.sleep(delay)
 
-    log.error(f"Could not read {file_path} after {retries} attempts")
+    log.error("Could not read %s after %s attempts", file_path, retries)
     return None
 
 
-def get_daily_note_path(for_date: datetime = None) -> Path:
-    """Get the path to the daily note for a given date."""
-    if for_date is None:
-        for_date = datetime.now()
-    date_str = for_date.strftime("%Y-%m-%d")
-    return DAILY_NOTES_FOLDER / f"{date_str}.md"
+def is_pending_record(record) -> bool:
+    """Check that a pending entry has the shape is_backing_off and failure_record expect."""
+    return (
+        isinstance(record, dict)
+        and "mtime" in record
+        and isinstance(record["mtime"], (int, float, type(None)))
+        and isinstance(record.get("attempts"), int)
+        and isinstance(record.get("last_attempt"), (int, float))
+    )
+
+
+def load_pending() -> dict:
+    """Load the record of input files that failed: {path: {mtime, attempts, last_attempt}}."""
+    try:
+        with open(PENDING_FILE, "rb") as f:
+            pending = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        log.warning("Ignoring unreadable %s: %s", PENDING_FILE, e)
+        return {}
+
+    if not isinstance(pending, dict) or not all(map(is_pending_record, pending.values())):
+        log.warning("Ignoring malformed %s", PENDING_FILE)
+        return {}
+    return pending
+
+
+def save_pending(pending: dict) -> None:
+    """Save the pending-file record."""
+    try:
+        PENDING_FILE.parent.mkdir(parents=True, exist_ok=True)
+        atomic_write(PENDING_FILE, json.dumps(pending, indent=2))
+    except Exception as e:
+        log.warning("Failed to save %s: %s", PENDING_FILE, e)
+
+
+def get_mtime(path: Path) -> float | None:
+    """Get a file's mtime, or None if it can't be stat'ed (e.g. iCloud syncing)."""
+    try:
+        return path.stat().st_mtime
+    except OSError:
+        return None
+
+
+def is_backing_off(record: dict | None, mtime: float | None, now: float) -> bool:
+    """
+    Check whether a previously failed file should be skipped this run.
+    A file that changed since its last failure is always retried.
+    """
+    if record is None or record["mtime"] != mtime:
+        return False
+    backoff = min(PENDING_BACKOFF_BASE * 2 ** (record["attempts"] - 1), PENDING_BACKOFF_MAX)
+    return now - record["last_attempt"] < backoff
 
 
-def format_entry(text: str, fmt: str, index: int = 1) -> str:
-    """Format a single entry according to the format type."""
-    if fmt == FORMAT_BLOCKQUOTE:
-        return f"> {text}"
-    elif fmt == FORMAT_BULLET:
-        return f"- {text}"
-    elif fmt == FORMAT_NUMBERED:
-        return f"{index}. {text}"
-    elif fmt == FORMAT_CHECKBOX:
-        return f"- [ ] {text}"
-    else:  # FORMAT_PLAIN
-        return text
+def failure_record(record: dict | None, mtime: float | None, now: float) -> dict:
+    """Build the pending record for a file that just failed (attempts restart if it changed)."""
+    same_file = record is not None and record["mtime"] == mtime
+    return {
+        "mtime": mtime,
+        "attempts": record["attempts"] + 1 if same_file else 1,
+        "last_attempt": now,
+    }
 
 
-def insert_at_marker(content: str, marker: str, entry_text: str) -> str | None:
+def claim_file(path: Path) -> Path | None:
     """
-    Insert entry after a marker in the content.
-    Returns new content or None if marker not found.
+    Claim an input file by renaming it to <name>.inflight.<pid> so an overlapping run skips it.
+    Returns the claimed path, or None if it couldn't be claimed (e.g. another run has it).
     """
-    if marker not in content:
+    claimed = path.with_name(f"{path.name}{INFLIGHT_MARKER}{os.getpid()}")
+    try:
+        path.rename(claimed)
+        return claimed
+    except FileNotFoundError:
+        log.debug("%s already claimed by another run", path.name)
+        return None
+    except OSError as e:
+        log.warning("Could not claim %s: %s", path.name, e)
         return None
 
-    marker_pos = content.find(marker)
-    line_end = content.find("\n", marker_pos)
-    if line_end == -1:
-        line_end = len(content)
-    else:
-        line_end += 1  # Include the newline
-
-    # For section headers (##), find next section or divider
-    if marker.startswith("##"):
-        rest = content[line_end:]
-        divider_pos = rest.find("\n---")
-        next_section = rest.find("\n## ")
-
-        if divider_pos != -1 and (next_section == -1 or divider_pos < next_section):
-            insert_pos = line_end + divider_pos + 1
-        elif next_section != -1:
-            insert_pos = line_end + next_section + 1
-        else:
-            insert_pos = line_end
-    else:
-        # For field markers, replace empty placeholder line if present
-        rest = content[line_end:]
-        first_line_end = rest.find("\n")
-        if first_line_end == -1:
-            first_line_end = len(rest)
-        first_line = rest[:first_line_end].strip()
-
-        # Check if first line is an empty placeholder (>, -, 1., etc.)
-        if first_line in (">", "-", "1.", "2.", "3.", ""):
-            # Replace the placeholder line
-            return content[:line_end] + entry_text + rest[first_line_end:]
-        else:
-            # Insert after marker
-            insert_pos = line_end
-            return content[:insert_pos] + entry_text + "\n" + content[insert_pos:]
 
-    return content[:insert_pos] + entry_text + "\n" + content[insert_pos:]
+def release_claim(claimed: Path, path: Path) -> None:
+    """Rename a claimed file back to its original name so a later run retries it."""
+    try:
+        claimed.rename(path)
+    except OSError as e:
+        log.error("Failed to release %s: %s", claimed.name, e)
+
 
+def is_process_alive(pid: int) -> bool:
+    """Check whether a process with the given pid exists."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # Exists, owned by someone else
+    return True
+
+
+def recover_stale_claim(claimed: Path) -> Path | None:
+    """
+    Release a claimed file whose owning run has exited (crashed mid-processing).
+    Returns the original path if recovered, else None.
+    """
+    name, _, pid = claimed.name.rpartition(INFLIGHT_MARKER)
+    if not name.endswith((".json", ".txt")) or not pid.isdigit() or is_process_alive(int(pid)):
+        return None
+
+    original = claimed.with_name(name)
+    try:
+        claimed.rename(original)
+    except OSError:
+        return None
+    log.warning("Recovered %s from a run that exited mid-processing", name)
+    return original
 
-def process_entry(entry: dict, daily_note: Path) -> bool:
+
+def parse_entry(entry: dict) -> tuple[str, dict, list[str]] | None:
     """
-    Process a single entry and write to daily note.
-    Returns True on success.
+    Validate an entry and normalize its text to a list of items.
+    Returns (section, section config, texts) or None if the entry is invalid.
     """
-    section = entry.get("section", "").lower()
+    if not isinstance(entry, dict):
+        log.warning("Invalid entry - expected a JSON object: %s", entry)
+        return None
+
+    section = entry.get("section")
+    section = section.lower() if isinstance(section, str) else ""
     text = entry.get("text", "")
 
     # Normalize text to list (handle string, list, or string that looks like a list)
     if isinstance(text, str):
         text = text.strip()
-        # Handle string that looks like JSON array: "[item1, item2]" or "[item]"
+        # Handle string that looks like JSON array: '["item1", "item2"]' or "[item]"
         if text.startswith("[") and text.endswith("]"):
-            try:
-                parsed = json.loads(text)
-                if isinstance(parsed, list):
-                    texts = [t.strip() for t in parsed if isinstance(t, str) and t.strip()]
-                else:
-                    texts = [text]
-            except json.JSONDecodeError:
-                # Not valid JSON, just strip the brackets
-                texts = [text[1:-1].strip()] if len(text) > 2 else []
+            # Only a quoted or multi-item list can be real JSON; "[item]" never is
+            if "," in text or '"' in text:
+                try:
+                    parsed = json.loads(text)
+                    if isinstance(parsed, list):
+                        texts = [t.strip() for t in parsed if isinstance(t, str) and t.strip()]
+                    else:
+                        texts = [text]
+                except json.JSONDecodeError:
+                    # Not valid JSON, just strip the brackets
+                    texts = [text[1:-1].strip()]
+            else:
+                inner = text[1:-1].strip()
+                texts = [inner] if inner else []
         else:
             texts = [text] if text else []
     elif isinstance(text, list):
@@ -216,41 +287,85 @@ def process_entry(entry: dict, daily_note: Path) -> bool:
         texts = []
 
     if not section or not texts:
-        log.warning(f"Invalid entry - missing section or text: {entry}")
-        return False
+        log.warning("Invalid entry - missing section or text: %s", entry)
+        return None
+
+    config = SECTIONS_BY_NAME.get(section)
+    if config is None:
+        log.error("Unknown section: %s", section)
+        return None
+
+    return section, config, texts
 
-    if section not in SECTIONS:
-        log.error(f"Unknown section: {section}")
-        return False
 
-    config = SECTIONS[section]
+def apply_items(content: str, section: str, config: dict, texts: list[str]) -> str | None:
+    """
+    Format items for a section and insert them into the daily note content (no file I/O).
+    Returns new content or None if the section marker is missing.
+    """
     marker = config["marker"]
     fmt = config["format"]
 
-    # Read current content
-    try:
-        content = daily_note.read_text()
-    except Exception as e:
-        log.error(f"Failed to read daily note: {e}")
-        return False
-
-    # Format and insert all items
-    formatted_lines = [format_entry(t, fmt, index=i+1) for i, t in enumerate(texts)]
-    formatted = "\n".join(formatted_lines)
+    # Format and insert all items (formatter resolved once per section)
+    format_fn = FORMATTERS.get(fmt, FORMATTERS[FORMAT_PLAIN])
+    formatted = "\n".join(format_fn(t, i) for i, t in enumerate(texts, 1))
     new_content = insert_at_marker(content, marker, formatted)
 
     if new_content is None:
-        log.error(f"Marker '{marker}' not found in daily note")
-        return False
+        log.error("Marker '%s' not found in daily note", marker)
+        return None
 
-    # Write
-    try:
-        daily_note.write_text(new_content)
-        log.info(f"Wrote to {section}: {text[:50]}...")
-        return True
-    except Exception as e:
-        log.error(f"Failed to write daily note: {e}")
-        return False
+    log.info("Added %s item(s) to %s: %s...", len(texts), section, texts[0][:50])
+    return new_content
+
+
+def apply_to_note(daily_note: Path, groups: dict[str, tuple[dict, list[str], list[Path]]]) -> list[Path]:
+    """
+    Read the daily note, insert each section's items and write it back once.
+    If the note changes on disk before the write (e.g. saved in Obsidian), it is
+    re-read and the items re-applied so that edit isn't overwritten.
+    groups maps section -> (section config, texts, input files).
+    Returns the input files whose items made it into the note.
+    """
+    for _ in range(NOTE_WRITE_ATTEMPTS):
+        try:
+            st = daily_note.stat()
+            content = daily_note.read_text()
+        except Exception as e:
+            log.error("Failed to read daily note: %s", e)
+            return []
+
+        # Apply each section's items (content is left untouched on failure)
+        applied_files = []
+        for section, (config, texts, files) in groups.items():
+            new_content = apply_items(content, section, config, texts)
+            if new_content is None:
+                continue
+            content = new_content
+            applied_files.extend(files)
+
+        if not applied_files:
+            return []
+
+        try:
+            current = daily_note.stat()
+        except OSError as e:
+            log.error("Failed to read daily note: %s", e)
+            return []
+        if (current.st_ino, current.st_mtime_ns, current.st_size) != (st.st_ino, st.st_mtime_ns, st.st_size):
+            log.warning("Daily note changed while applying entries, re-reading it")
+            continue
+
+        try:
+            atomic_write(daily_note, content)
+        except Exception as e:
+            log.error("Failed to write daily note: %s", e)
+            return []
+        log.info("Wrote %s entry(ies) to %s", len(applied_files), daily_note.name)
+        return applied_files
+
+    log.error("Daily note kept changing, leaving entries for the next run")
+    return []
 
 
 def main() -> int:
@@ -261,52 +376,118 @@ def main() -> int:
     # Check daily note exists
     daily_note = get_daily_note_path()
     if not daily_note.exists():
-        log.error(f"Daily note does not exist: {daily_note}")
+        log.error("Daily note does not exist: %s", daily_note)
         return 1
 
     # Collect files from all input folders
     json_files = []
     for folder in ICLOUD_INPUT_FOLDERS:
         if not folder.exists():
-            log.debug(f"Input folder does not exist: {folder}")
+            log.debug("Input folder does not exist: %s", folder)
             continue
         trigger_icloud_download(folder)
-        json_files.extend(folder.glob("*.json"))
-        json_files.extend(folder.glob("*.txt"))
+        with os.scandir(folder) as it:
+            for e in it:
+                if not e.is_file():
+                    continue
+                if INFLIGHT_MARKER in e.name:
+                    recovered = recover_stale_claim(Path(e.path))
+                    if recovered is not None:
+                        json_files.append(recovered)
+                elif e.name.endswith((".json", ".txt")):
+                    json_files.append(Path(e.path))
+
+    if not json_files:
+        log.info("No files to process")
+        return 0
+
+    log.info("Found %s file(s) to process", len(json_files))
+
+    # Skip files that keep failing until their backoff expires. Every retry renames the
+    # file twice (claim and release), which fires launchd's WatchPaths again.
+    pending = load_pending()
+    previous_pending = dict(pending)
+    current = {str(f) for f in json_files}
+    pending = {k: v for k, v in pending.items() if k in current}
+    now = time.time()
+    mtimes = {f: get_mtime(f) for f in json_files}
+    ready_files = [f for f in json_files if not is_backing_off(pending.get(str(f)), mtimes[f], now)]
+    if len(ready_files) < len(json_files):
+        log.info("Backing off %s file(s) that failed earlier", len(json_files) - len(ready_files))
+    json_files = ready_files
+
+    if not json_files:
+        if pending != previous_pending:
+            save_pending(pending)
+        return 0
+
+    # Claim files before loading them. launchd never overlaps this job with itself, but a
+    # manual run started while the job is running must not process them too
+    claimed = {}
+    for json_file in json_files:
+        claimed_path = claim_file(json_file)
+        if claimed_path is not None:
+            claimed[json_file] = claimed_path
+    json_files = list(claimed)
 
     if not json_files:
         log.info("No files to process")
         return 0
 
-    log.info(f"Found {len(json_files)} file(s) to process")
+    # Load files concurrently so iCloud download waits overlap
+    with ThreadPoolExecutor(max_workers=min(8, len(json_files))) as pool:
+        entries = list(pool.map(load_json_file, claimed.values()))
 
+    groups = {}
     success_count = 0
     fail_count = 0
 
-    for json_file in json_files:
-        log.info(f"Processing: {json_file.name}")
+    for json_file, entry in zip(json_files, entries):
+        log.info("Processing: %s", json_file.name)
 
-        # Load JSON
-        entry = load_json_file(json_file)
         if entry is None:
-            log.error(f"Failed to load {json_file.name}")
+            log.error("Failed to load %s", json_file.name)
             fail_count += 1
             continue
 
-        # Process entry
-        if process_entry(entry, daily_note):
-            # Delete file on success
-            try:
-                json_file.unlink()
-                log.info(f"Deleted: {json_file.name}")
-                success_count += 1
-            except Exception as e:
-                log.error(f"Failed to delete {json_file.name}: {e}")
-                fail_count += 1
-        else:
+        parsed = parse_entry(entry)
+        if parsed is None:
+            fail_count += 1
+            continue
+
+        # Group items by section so each section is inserted once
+        section, config, texts = parsed
+        _, section_texts, section_files = groups.setdefault(section, (config, [], []))
+        section_texts.extend(texts)
+        section_files.append(json_file)
+
+    # Only read the note now: loading can wait on iCloud for a while, and anything saved
+    # to the note in the meantime (Obsidian, an overlapping run) must not be overwritten
+    applied_files = apply_to_note(daily_note, groups) if groups else []
+    fail_count += sum(len(files) for _, _, files in groups.values()) - len(applied_files)
+
+    # Delete what made it into the note; hand everything else back, backed off like
+    # load failures so a file that can never apply isn't retried on every run
+    applied = set(applied_files)
+    for json_file in json_files:
+        key = str(json_file)
+        if json_file not in applied:
+            release_claim(claimed[json_file], json_file)
+            pending[key] = failure_record(pending.get(key), mtimes[json_file], now)
+            continue
+        pending.pop(key, None)
+        try:
+            claimed[json_file].unlink()
+            log.info("Deleted: %s", json_file.name)
+            success_count += 1
+        except Exception as e:
+            log.error("Failed to delete %s: %s", json_file.name, e)
             fail_count += 1
 
-    log.info(f"Complete: {success_count} succeeded, {fail_count} failed")
+    if pending != previous_pending:
+        save_pending(pending)
+
+    log.info("Complete: %s succeeded, %s failed", success_count, fail_count)
     return 0 if fail_count == 0 else 1
 
 
@@ -3,175 +3,212 @@
 HTTP server for receiving log entries from iOS Shortcuts.
 Writes directly to Obsidian daily notes - no iCloud needed.
 
+POST /obsidian/daily: {"section": "log", "text": "My text..." | ["item1", "item2"], "timestamp": true}
+Send multiple items as a JSON array; a string that looks like a list ("[a, b]") is
+still accepted for older Shortcuts.
+
 Run with: uv run python server.py
 """
 import json
-import logging
+import queue
+import threading
 from datetime import datetime
-from http.server import HTTPServer, BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 from pathlib import Path
 
-from config import DAILY_NOTES_FOLDER, SECTIONS, LOG_FILE
-from config import FORMAT_PLAIN, FORMAT_BLOCKQUOTE, FORMAT_BULLET, FORMAT_NUMBERED, FORMAT_CHECKBOX
+from config import SECTIONS, LOG_FILE, FORMAT_PLAIN, FORMAT_CHECKBOX
+from daily_notes import FORMATTERS as NOTE_FORMATTERS
+from daily_notes import atomic_write, get_daily_note_path, insert_at_marker
+from log_setup import setup_logging
 
 # Server config
 HOST = "0.0.0.0"  # Listen on all interfaces (needed for Tailscale)
 PORT = 8080
+WRITE_TIMEOUT = 30  # Seconds a request waits for its note write
+
+# Entry formatters; the server numbers its checkbox items
+FORMATTERS = {**NOTE_FORMATTERS, FORMAT_CHECKBOX: lambda text, index: f"{index}. [ ] {text}"}
 
 # Logging setup
-log = logging.getLogger(__name__)
-log.setLevel(logging.INFO)
-
-console_handler = logging.StreamHandler()
-console_handler.setFormatter(logging.Formatter(
-    "%(asctime)s [%(levelname)s] %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S"
-))
-log.addHandler(console_handler)
-
-file_handler = logging.FileHandler(LOG_FILE)
-file_handler.setFormatter(logging.Formatter(
-    "%(asctime)s [%(levelname)s] %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S"
-))
-log.addHandler(file_handler)
-
-
-def get_daily_note_path(for_date: datetime = None) -> Path:
-    """Get the path to the daily note for a given date."""
-    if for_date is None:
-        for_date = datetime.now()
-    date_str = for_date.strftime("%Y-%m-%d")
-    return DAILY_NOTES_FOLDER / f"{date_str}.md"
-
-
-def format_entry(text: str, fmt: str, index: int = 1) -> str:
-    """Format a single entry according to the format type."""
-    if fmt == FORMAT_BLOCKQUOTE:
-        return f"> {text}"
-    elif fmt == FORMAT_BULLET:
-        return f"- {text}"
-    elif fmt == FORMAT_NUMBERED:
-        return f"{index}. {text}"
-    elif fmt == FORMAT_CHECKBOX:
-        return f"{index}. [ ] {text}"
-    else:  # FORMAT_PLAIN
-        return text
-
-
-def insert_at_marker(content: str, marker: str, entry_text: str) -> str | None:
-    """Insert entry after a marker in the content."""
-    if marker not in content:
-        return None
-
-    marker_pos = content.find(marker)
-    line_end = content.find("\n", marker_pos)
-    if line_end == -1:
-        line_end = len(content)
-    else:
-        line_end += 1
+log = setup_logging(__name__, LOG_FILE)
 
-    if marker.startswith("##"):
-        rest = content[line_end:]
-        divider_pos = rest.find("\n---")
-        next_section = rest.find("\n## ")
+# Note writes queued by request threads for the writer thread:
+# {"section", "marker", "formatted", "done": Event, "taken": bool, "abandoned": bool,
+#  "result": (success, message)}
+write_queue: queue.Queue = queue.Queue()
 
-        if divider_pos != -1 and (next_section == -1 or divider_pos < next_section):
-            insert_pos = line_end + divider_pos + 1
-        elif next_section != -1:
-            insert_pos = line_end + next_section + 1
-        else:
-            insert_pos = line_end
-    else:
-        rest = content[line_end:]
-        first_line_end = rest.find("\n")
-        if first_line_end == -1:
-            first_line_end = len(rest)
-        first_line = rest[:first_line_end].strip()
-
-        if first_line in (">", "-", "1.", "2.", "3.", ""):
-            return content[:line_end] + entry_text + rest[first_line_end:]
-        else:
-            insert_pos = line_end
-            return content[:insert_pos] + entry_text + "\n" + content[insert_pos:]
+# Guards the hand-off between a timed-out request (abandoned) and the writer (taken)
+write_lock = threading.Lock()
 
-    return content[:insert_pos] + entry_text + "\n" + content[insert_pos:]
+# Last content written per note: {path: ((inode, mtime_ns, size), content)}
+note_cache: dict[Path, tuple[tuple[int, int, int], str]] = {}
 
 
-def process_entry(entry: dict) -> tuple[bool, str]:
-    """Process an entry and write to daily note. Returns (success, message)."""
+def process_entry(entry: dict) -> tuple[int, str]:
+    """Process an entry and write to daily note. Returns (HTTP status, message)."""
     section = entry.get("section", "").lower()
     text = entry.get("text", "")
     # Accept boolean true or string "true" for timestamp
     ts_value = entry.get("timestamp", False)
     add_timestamp = ts_value is True or ts_value == "true"
 
-    # Normalize text to list
-    if isinstance(text, str):
+    # Normalize text to list (a JSON array is the fast path)
+    if isinstance(text, list):
+        texts = [t.strip() for t in text if isinstance(t, str) and t.strip()]
+    elif isinstance(text, str):
         text = text.strip()
         if text.startswith("[") and text.endswith("]"):
-            try:
-                parsed = json.loads(text)
-                if isinstance(parsed, list):
-                    texts = [t.strip() for t in parsed if isinstance(t, str) and t.strip()]
-                else:
-                    texts = [text]
-            except json.JSONDecodeError:
-                texts = [text[1:-1].strip()] if len(text) > 2 else []
+            # Legacy list-looking string; only a quoted or multi-item one can be JSON
+            if "," in text or '"' in text:
+                try:
+                    parsed = json.loads(text)
+                    if isinstance(parsed, list):
+                        texts = [t.strip() for t in parsed if isinstance(t, str) and t.strip()]
+                    else:
+                        texts = [text]
+                except json.JSONDecodeError:
+                    texts = [text[1:-1].strip()]
+            else:
+                inner = text[1:-1].strip()
+                texts = [inner] if inner else []
         else:
             texts = [text] if text else []
-    elif isinstance(text, list):
-        texts = [t.strip() for t in text if isinstance(t, str) and t.strip()]
     else:
         texts = []
 
     if not section or not texts:
-        return False, f"Invalid entry - missing section or text"
+        return 400, f"Invalid entry - missing section or text"
 
     if section not in SECTIONS:
-        return False, f"Unknown section: {section}"
+        return 400, f"Unknown section: {section}"
 
     config = SECTIONS[section]
     marker = config["marker"]
-    fmt = config["format"]
+    format_fn = FORMATTERS.get(config["format"], FORMATTERS[FORMAT_PLAIN])
 
-    daily_note = get_daily_note_path()
-    if not daily_note.exists():
-        return False, f"Daily note does not exist: {daily_note}"
+    if add_timestamp:
+        prefix = datetime.now().strftime("- %H:%M ")
+        formatted = "\n".join(prefix + t for t in texts)
+    else:
+        formatted = "\n".join(format_fn(t, i) for i, t in enumerate(texts, 1))
+
+    # Hand the write to the note writer thread and wait for its outcome
+    write = {
+        "section": section, "marker": marker, "formatted": formatted,
+        "done": threading.Event(), "taken": False, "abandoned": False,
+    }
+    write_queue.put(write)
+    if not write["done"].wait(timeout=WRITE_TIMEOUT):
+        # Give up only if the writer hasn't picked it up; otherwise its result is on the way
+        # and answering now would make the Shortcut retry an entry that does get written
+        with write_lock:
+            write["abandoned"] = not write["taken"]
+        if write["abandoned"]:
+            return 503, "Timed out waiting for daily note write"
+        write["done"].wait()
+
+    success, message = write["result"]
+    if success:
+        log.info("Wrote to %s: %s...", section, texts[0][:50])
+    return (200 if success else 400), message
+
+
+def fail_writes(writes: list[dict], message: str) -> None:
+    """Mark every queued write in the list as failed with the same message."""
+    for write in writes:
+        write["result"] = (False, message)
+
+
+def apply_writes(writes: list[dict]) -> None:
+    """
+    Apply a batch of queued writes to today's note with one read and one write.
+    Sets each write's "result" to (success, message); writes whose request timed out are skipped.
+    """
+    with write_lock:
+        writes = [w for w in writes if not w["abandoned"]]
+        for write in writes:
+            write["taken"] = True
+    if not writes:
+        return
 
+    daily_note = get_daily_note_path()
     try:
-        content = daily_note.read_text()
+        st = daily_note.stat()
+    except FileNotFoundError:
+        return fail_writes(writes, f"Daily note does not exist: {daily_note}")
     except Exception as e:
-        return False, f"Failed to read daily note: {e}"
+        return fail_writes(writes, f"Failed to read daily note: {e}")
 
-    if add_timestamp:
-        time_str = datetime.now().strftime("%H:%M")
-        formatted_lines = [f"- {time_str} {t}" for t in texts]
+    # Reuse our last write unless the note changed on disk since (e.g. edited in Obsidian)
+    cached = note_cache.get(daily_note)
+    if cached is not None and cached[0] == (st.st_ino, st.st_mtime_ns, st.st_size):
+        content = cached[1]
     else:
-        formatted_lines = [format_entry(t, fmt, index=i+1) for i, t in enumerate(texts)]
-    formatted = "\n".join(formatted_lines)
-    new_content = insert_at_marker(content, marker, formatted)
+        try:
+            content = daily_note.read_text()
+        except Exception as e:
+            return fail_writes(writes, f"Failed to read daily note: {e}")
+
+    applied = []
+    for write in writes:
+        new_content = insert_at_marker(content, write["marker"], write["formatted"])
+        if new_content is None:
+            write["result"] = (False, f"Marker '{write['marker']}' not found in daily note")
+            continue
+        content = new_content
+        applied.append(write)
 
-    if new_content is None:
-        return False, f"Marker '{marker}' not found in daily note"
+    if not applied:
+        return
 
     try:
-        daily_note.write_text(new_content)
-        log.info(f"Wrote to {section}: {texts[0][:50]}...")
-        return True, f"OK: wrote to {section}"
+        # Key the cache on the file we wrote, not a stat taken after the replace that
+        # could already describe someone else's version of the note
+        st = atomic_write(daily_note, content)
     except Exception as e:
-        return False, f"Failed to write daily note: {e}"
+        note_cache.clear()
+        return fail_writes(applied, f"Failed to write daily note: {e}")
+
+    # Only today's note is worth keeping
+    note_cache.clear()
+    note_cache[daily_note] = ((st.st_ino, st.st_mtime_ns, st.st_size), content)
+
+    if len(applied) > 1:
+        log.info("Coalesced %s entries into one note write", len(applied))
+    for write in applied:
+        write["result"] = (True, f"OK: wrote to {write['section']}")
+
+
+def note_writer():
+    """Apply queued note writes forever; whatever queued up meanwhile goes in one batch."""
+    while True:
+        writes = [write_queue.get()]
+        while True:
+            try:
+                writes.append(write_queue.get_nowait())
+            except queue.Empty:
+                break
+
+        try:
+            apply_writes(writes)
+        except Exception as e:
+            log.error("Error writing daily note: %s", e)
+            fail_writes([w for w in writes if "result" not in w], f"Server error: {e}")
+
+        for write in writes:
+            write["done"].set()
 
 
 class LogHandler(BaseHTTPRequestHandler):
     """HTTP request handler for log entries."""
 
     def _send_response(self, status: int, message: str):
+        response = json.dumps({"status": "ok" if status == 200 else "error", "message": message}).encode()
         self.send_response(status)
         self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(response)))
         self.end_headers()
-        response = json.dumps({"status": "ok" if status == 200 else "error", "message": message})
-        self.wfile.write(response.encode())
+        self.wfile.write(response)
 
     def do_GET(self):
         """Health check endpoint."""
@@ -188,18 +225,18 @@ class LogHandler(BaseHTTPRequestHandler):
 
         try:
             content_length = int(self.headers.get("Content-Length", 0))
-            body = self.rfile.read(content_length).decode()
-            entry = json.loads(body)
-            log.info(f"Received: {entry}")
+            # json.loads detects the encoding itself, no need to decode first
+            entry = json.loads(self.rfile.read(content_length))
+            log.info("Received: %s", entry)
 
-            success, message = process_entry(entry)
-            self._send_response(200 if success else 400, message)
+            status, message = process_entry(entry)
+            self._send_response(status, message)
 
-        except json.JSONDecodeError as e:
-            log.error(f"Invalid JSON: {e}")
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            log.error("Invalid JSON: %s", e)
             self._send_response(400, f"Invalid JSON: {e}")
         except Exception as e:
-            log.error(f"Error processing request: {e}")
+            log.error("Error processing request: %s", e)
             self._send_response(500, f"Server error: {e}")
 
     def log_message(self, format, *args):
@@ -212,8 +249,10 @@ class LogHandler(BaseHTTPRequestHandler):
 
 
 def main():
-    log.info(f"Starting server on {HOST}:{PORT}")
-    server = HTTPServer((HOST, PORT), LogHandler)
+    log.info("Starting server on %s:%s", HOST, PORT)
+    # Single writer thread owns the daily note, so request threads never race on it
+    threading.Thread(target=note_writer, name="note-writer", daemon=True).start()
+    server = ThreadingHTTPServer((HOST, PORT), LogHandler)
     try:
         server.serve_forever()
     except KeyboardInterrupt:
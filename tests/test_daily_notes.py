@@ -0,0 +1,69 @@
+"""Tests for daily_notes.insert_at_marker.
+
+Run with: python -m unittest discover -s tests
+"""
+import unittest
+
+from daily_notes import insert_at_marker
+
+GRATITUDE = "**Grateful for:**\n1.\n2.\n3.\n\n**Next:**\n"
+
+
+class FieldMarkerTest(unittest.TestCase):
+    def test_single_item_fills_first_slot_and_keeps_the_rest(self):
+        self.assertEqual(
+            insert_at_marker(GRATITUDE, "**Grateful for:**", "1. coffee"),
+            "**Grateful for:**\n1. coffee\n2.\n3.\n\n**Next:**\n",
+        )
+
+    def test_several_items_fill_one_slot_each(self):
+        self.assertEqual(
+            insert_at_marker(GRATITUDE, "**Grateful for:**", "1. coffee\n2. sun"),
+            "**Grateful for:**\n1. coffee\n2. sun\n3.\n\n**Next:**\n",
+        )
+        self.assertEqual(
+            insert_at_marker(GRATITUDE, "**Grateful for:**", "1. coffee\n2. sun\n3. rest"),
+            "**Grateful for:**\n1. coffee\n2. sun\n3. rest\n\n**Next:**\n",
+        )
+
+    def test_only_slots_of_the_same_kind_are_filled(self):
+        self.assertEqual(
+            insert_at_marker("**Mood:**\n>\n3.\n", "**Mood:**", "> calm\n> rested"),
+            "**Mood:**\n> calm\n> rested\n3.\n",
+        )
+
+    def test_blank_first_line_only_fills_its_own_slot(self):
+        self.assertEqual(
+            insert_at_marker("**Notes:**\n\n\n**Next:**\n", "**Notes:**", "a\nb"),
+            "**Notes:**\na\nb\n\n**Next:**\n",
+        )
+
+    def test_filled_field_inserts_after_marker(self):
+        self.assertEqual(
+            insert_at_marker("**Notes:**\nold\n", "**Notes:**", "new"),
+            "**Notes:**\nnew\nold\n",
+        )
+
+    def test_missing_marker(self):
+        self.assertIsNone(insert_at_marker(GRATITUDE, "**Absent:**", "x"))
+
+
+class SectionMarkerTest(unittest.TestCase):
+    def test_appends_before_divider(self):
+        self.assertEqual(
+            insert_at_marker("## Log\nold\n---\nfooter\n", "## Log", "new"),
+            "## Log\nold\nnew\n---\nfooter\n",
+        )
+
+    def test_appends_before_next_section(self):
+        self.assertEqual(
+            insert_at_marker("## Log\nold\n## Next\n---\n", "## Log", "new"),
+            "## Log\nold\nnew\n## Next\n---\n",
+        )
+
+    def test_appends_after_header_at_end_of_note(self):
+        self.assertEqual(insert_at_marker("## Log\n", "## Log", "new"), "## Log\nnew\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
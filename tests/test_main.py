@@ -0,0 +1,161 @@
+"""Tests for main.py's note writes, pending-file backoff and claim recovery.
+
+Run with: python -m unittest discover -s tests
+"""
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import main
+
+
+def setUpModule():
+    logging.disable(logging.CRITICAL)
+
+
+def tearDownModule():
+    logging.disable(logging.NOTSET)
+
+
+class BackoffTest(unittest.TestCase):
+    def test_backoff_expires_after_base_delay(self):
+        record = {"mtime": 5.0, "attempts": 1, "last_attempt": 1000.0}
+        self.assertTrue(main.is_backing_off(record, 5.0, 1000.0 + main.PENDING_BACKOFF_BASE - 1))
+        self.assertFalse(main.is_backing_off(record, 5.0, 1000.0 + main.PENDING_BACKOFF_BASE))
+
+    def test_backoff_doubles_per_attempt_up_to_max(self):
+        record = {"mtime": 5.0, "attempts": 3, "last_attempt": 0.0}
+        self.assertTrue(main.is_backing_off(record, 5.0, 4 * main.PENDING_BACKOFF_BASE - 1))
+        self.assertFalse(main.is_backing_off(record, 5.0, 4 * main.PENDING_BACKOFF_BASE))
+
+        record["attempts"] = 100
+        self.assertFalse(main.is_backing_off(record, 5.0, main.PENDING_BACKOFF_MAX))
+
+    def test_changed_file_is_retried_immediately(self):
+        record = {"mtime": 5.0, "attempts": 1, "last_attempt": 1000.0}
+        self.assertFalse(main.is_backing_off(record, 6.0, 1000.0))
+        self.assertFalse(main.is_backing_off(None, 5.0, 1000.0))
+
+    def test_failure_record_restarts_attempts_for_changed_file(self):
+        record = {"mtime": 5.0, "attempts": 2, "last_attempt": 1000.0}
+        self.assertEqual(main.failure_record(record, 5.0, 2000.0)["attempts"], 3)
+        self.assertEqual(main.failure_record(record, 6.0, 2000.0)["attempts"], 1)
+
+
+class LoadPendingTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.pending_file = Path(tmp.name) / "pending.json"
+        patcher = mock.patch.object(main, "PENDING_FILE", self.pending_file)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_missing_file(self):
+        self.assertEqual(main.load_pending(), {})
+
+    def test_valid_file(self):
+        pending = {"/in/a.json": {"mtime": 5.0, "attempts": 1, "last_attempt": 1000.0}}
+        self.pending_file.write_text(json.dumps(pending))
+        self.assertEqual(main.load_pending(), pending)
+
+    def test_malformed_file_is_ignored(self):
+        for data in ("[]", '{"/in/a.json": {"attempts": 1, "last_attempt": 0}}', '{"/in/a.json": 1}', "{"):
+            with self.subTest(data=data):
+                self.pending_file.write_text(data)
+                self.assertEqual(main.load_pending(), {})
+
+
+class StaleClaimTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.folder = Path(tmp.name)
+
+    def test_claim_of_exited_run_is_recovered(self):
+        child = subprocess.Popen([sys.executable, "-c", ""])
+        child.wait()
+        claimed = self.folder / f"a.json{main.INFLIGHT_MARKER}{child.pid}"
+        claimed.write_text("{}")
+
+        self.assertEqual(main.recover_stale_claim(claimed), self.folder / "a.json")
+        self.assertTrue((self.folder / "a.json").exists())
+        self.assertFalse(claimed.exists())
+
+    def test_claim_of_running_process_is_left_alone(self):
+        claimed = self.folder / f"a.json{main.INFLIGHT_MARKER}{os.getpid()}"
+        claimed.write_text("{}")
+
+        self.assertIsNone(main.recover_stale_claim(claimed))
+        self.assertTrue(claimed.exists())
+
+
+class MainTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        root = Path(tmp.name)
+        self.inbox = root / "inbox"
+        self.inbox.mkdir()
+        self.note = root / "note.md"
+        self.note.write_text("## 📝 Daily Log\n---\n")
+        self.pending_file = root / "pending.json"
+
+        for patcher in (
+            mock.patch.object(main, "ICLOUD_INPUT_FOLDERS", [self.inbox]),
+            mock.patch.object(main, "PENDING_FILE", self.pending_file),
+            mock.patch.object(main, "get_daily_note_path", return_value=self.note),
+            mock.patch.object(main, "trigger_icloud_download"),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_unknown_section_is_backed_off_and_left_in_place(self):
+        bad = self.inbox / "bad.json"
+        bad.write_text(json.dumps({"section": "nope", "text": "x"}))
+
+        self.assertEqual(main.main(), 1)
+        self.assertEqual(json.loads(self.pending_file.read_text())[str(bad)]["attempts"], 1)
+        self.assertEqual([p.name for p in self.inbox.iterdir()], ["bad.json"])
+
+        # The next run skips it without claiming (renaming) it
+        with mock.patch.object(main, "claim_file") as claim_file:
+            self.assertEqual(main.main(), 0)
+        claim_file.assert_not_called()
+
+    def test_note_edit_made_while_loading_is_kept(self):
+        (self.inbox / "a.json").write_text(json.dumps({"section": "log", "text": "from watch"}))
+        load_json_file = main.load_json_file
+
+        def edit_then_load(path):
+            self.note.write_text(self.note.read_text() + "typed in Obsidian\n")
+            return load_json_file(path)
+
+        with mock.patch.object(main, "load_json_file", side_effect=edit_then_load):
+            self.assertEqual(main.main(), 0)
+        self.assertEqual(self.note.read_text(), "## 📝 Daily Log\nfrom watch\n---\ntyped in Obsidian\n")
+
+    def test_note_changed_before_write_is_reread(self):
+        (self.inbox / "a.json").write_text(json.dumps({"section": "log", "text": "from watch"}))
+        apply_items = main.apply_items
+        edits = []
+
+        def apply_with_edit(content, *args):
+            if not edits:
+                edits.append(1)
+                self.note.write_text(self.note.read_text() + "typed in Obsidian\n")
+            return apply_items(content, *args)
+
+        with mock.patch.object(main, "apply_items", side_effect=apply_with_edit):
+            self.assertEqual(main.main(), 0)
+        self.assertEqual(self.note.read_text(), "## 📝 Daily Log\nfrom watch\n---\ntyped in Obsidian\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
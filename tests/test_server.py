@@ -0,0 +1,114 @@
+"""Tests for server.py's note writer: batching, timeouts and abandoned writes.
+
+Run with: python -m unittest discover -s tests
+"""
+import logging
+import queue
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from unittest import mock
+
+import server
+
+NOTE = "## 📝 Daily Log\n---\n"
+
+
+def setUpModule():
+    logging.disable(logging.CRITICAL)
+
+
+def tearDownModule():
+    logging.disable(logging.NOTSET)
+
+
+def start_writer():
+    """Run a note writer on the current server.write_queue (it stays blocked after the test)."""
+    threading.Thread(target=server.note_writer, daemon=True).start()
+
+
+class WriterTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.note = Path(tmp.name) / "note.md"
+        self.note.write_text(NOTE)
+        server.note_cache.clear()
+
+        # A fresh queue per test so writers from other tests never see its writes
+        for patcher in (
+            mock.patch.object(server, "get_daily_note_path", return_value=self.note),
+            mock.patch.object(server, "write_queue", queue.Queue()),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def make_write(self, text: str, **flags) -> dict:
+        write = {
+            "section": "log", "marker": "## 📝 Daily Log", "formatted": text,
+            "done": threading.Event(), "taken": False, "abandoned": False,
+        }
+        write.update(flags)
+        return write
+
+    def test_concurrent_entries_are_each_written_once(self):
+        start_writer()
+        entries = [{"section": "log", "text": f"entry {i}"} for i in range(30)]
+        entries.append({"section": "intention", "text": "no marker for this one"})
+
+        with ThreadPoolExecutor(max_workers=10) as pool:
+            results = list(pool.map(server.process_entry, entries))
+
+        self.assertEqual([status for status, _ in results[:-1]], [200] * 30)
+        status, message = results[-1]
+        self.assertEqual(status, 400)
+        self.assertIn("not found", message)
+
+        lines = self.note.read_text().splitlines()
+        for i in range(30):
+            self.assertEqual(lines.count(f"entry {i}"), 1)
+        self.assertEqual(len(lines), 32)
+
+    def test_abandoned_write_is_skipped(self):
+        abandoned = self.make_write("gave up", abandoned=True)
+        live = self.make_write("still waiting")
+
+        server.apply_writes([abandoned, live])
+
+        self.assertEqual(self.note.read_text(), "## 📝 Daily Log\nstill waiting\n---\n")
+        self.assertNotIn("result", abandoned)
+        self.assertFalse(abandoned["taken"])
+        self.assertEqual(live["result"][0], True)
+
+    def test_timed_out_entry_answers_503_and_is_never_written(self):
+        with mock.patch.object(server, "WRITE_TIMEOUT", 0.05):
+            status, _ = server.process_entry({"section": "log", "text": "too late"})
+        self.assertEqual(status, 503)
+
+        # The writer only gets to it now, after the request gave up
+        write = server.write_queue.get_nowait()
+        self.assertTrue(write["abandoned"])
+        server.apply_writes([write])
+        self.assertEqual(self.note.read_text(), NOTE)
+
+    def test_timeout_after_writer_took_the_write_waits_for_its_result(self):
+        atomic_write = server.atomic_write
+
+        def slow_atomic_write(path, data):
+            time.sleep(1)
+            return atomic_write(path, data)
+
+        start_writer()
+        with mock.patch.object(server, "WRITE_TIMEOUT", 0.2), \
+                mock.patch.object(server, "atomic_write", side_effect=slow_atomic_write):
+            status, _ = server.process_entry({"section": "log", "text": "slow"})
+
+        self.assertEqual(status, 200)
+        self.assertEqual(self.note.read_text(), "## 📝 Daily Log\nslow\n---\n")
+
+
+if __name__ == "__main__":
+    unittest.main()